@@ -14,7 +14,7 @@
 import asyncio
 import logging
 import sys
-from typing import Dict, Set
+from typing import Dict, List
 
 from pyrlang.dist_proto import DistributionFlags, ErlangDistribution
 from pyrlang.dist_proto.base_dist_protocol import BaseDistProtocol
@@ -68,6 +68,10 @@ class Node:
 
         self.node_db.register(self)
 
+        self._event_loop = asyncio.get_event_loop()
+        """ Event loop this node and its processes run on, set before any
+            process is spawned as they cache it. """
+
         self.inbox_ = asyncio.Queue()
         """ Contains Pyrlang's own messages to the local node. """
 
@@ -99,8 +103,6 @@ class Node:
         if not hidden:
             self.node_opts_.set_node_published()
 
-        self._signal_wakeups = set()  # type: Set[Pid]
-
         self.dist_nodes_ = {}  # type: Dict[str, BaseDistProtocol]
         self.dist_ = ErlangDistribution(node_name=node_name)
 
@@ -112,7 +114,6 @@ class Node:
         # handles special ping messages
         self.net_kernel_ = NetKernel()
 
-        self._event_loop = asyncio.get_event_loop()
         self._event_loop.create_task(self._async_loop())
         # future object we're awaiting when running the loop for the node
         self.__completed_future = self._event_loop.create_future()
@@ -127,18 +128,6 @@ class Node:
 
         # LOG.info("Node async_loop ended")
 
-    async def handle_signals(self):
-        while self._signal_wakeups:
-            s_pid = self._signal_wakeups.pop()
-            if s_pid not in self.processes_:
-                LOG.info("got signal for untracked process %s", s_pid)
-                continue
-            await self.processes_[s_pid].handle_signals()
-
-    def signal_wake_up(self, pid):
-        self._signal_wakeups.add(pid)
-        self._event_loop.create_task(self.handle_signals())
-
     def on_exit_process(self, exiting_pid, reason):
         LOG.info("Process %s exited with %s", exiting_pid, reason)
         del self.processes_[exiting_pid]
@@ -284,7 +273,7 @@ class Node:
         if receiver_obj is not None:
             LOG.info("Send local reg=%s receiver=%s msg=%s",
                      receiver, receiver_obj, message)
-            receiver_obj.deliver_message(msg=message)
+            receiver_obj.deliver_message(message)
         else:
             LOG.warning("Send to unknown %s ignored", receiver)
 
@@ -300,14 +289,14 @@ class Node:
         dst = self.where_is_process(receiver)
         if dst is not None:
             LOG.debug("Node._send_local: to %s <- %s", receiver, message)
-            dst.deliver_message(msg=message)
+            dst.deliver_message(message)
         else:
             LOG.warning("Node._send_local: receiver %s does not exist",
                         receiver)
 
     async def _send_remote(self, sender, dst_node: str, receiver,
                            message) -> None:
-        LOG.debug("send_remote to %s <- %s" % (receiver, message))
+        LOG.debug("send_remote to %s <- %s", receiver, message)
         m = ('send', sender, receiver, message)
         return await self.dist_command(receiver_node=dst_node,
                                        message=m)
@@ -593,6 +582,34 @@ class Node:
                                      reason=reason,
                                      dist_protocol_message='exit')
 
+    def send_link_exit_notifications(self, sender, receivers, reason):
+        """ Delivers exit message due to a linked process dead to many local
+            or remote processes. Local processes are signalled right away,
+            remote ones are sent in one task per remote node, so a slow
+            connection does not delay the others.
+        """
+        remote = {}  # type: Dict[str, List[Pid]]
+        for receiver in receivers:
+            if receiver.is_local_to(self):
+                recvp = self.processes_.get(receiver, None)
+                if recvp is not None:
+                    recvp.exit(reason=reason)
+            else:
+                remote.setdefault(receiver.node_name_, []).append(receiver)
+
+        for (node_name, node_receivers) in remote.items():
+            link_exit_task = self._send_remote_link_exits(sender,
+                                                          node_name,
+                                                          node_receivers,
+                                                          reason)
+            self._event_loop.create_task(link_exit_task)
+
+    async def _send_remote_link_exits(self, sender, node_name: str,
+                                      receivers, reason):
+        for receiver in receivers:
+            distm = ('exit', sender, receiver, reason)
+            await self.dist_command(receiver_node=node_name, message=distm)
+
     async def _send_exit_signal(self, sender, receiver, reason,
                                 dist_protocol_message: str = 'exit'):
         """ Deliver local or remote exit signal to a process.
@@ -12,8 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import asyncio
+import collections
 import logging
-from typing import Set, Dict, List, Tuple, Any
+from typing import Set, Dict, Tuple, Any, Callable, Optional, Union
 
 from pyrlang.node_db import NodeDB
 from pyrlang.match import Match
@@ -22,8 +23,105 @@ from term.atom import Atom
 from term.pid import Pid
 from term.reference import Reference
 
+try:
+    from asyncio import timeout as async_timeout  # Python 3.11+
+except ImportError:
+    from async_timeout import timeout as async_timeout
+
 LOG = logging.getLogger(__name__)
 
+BATCH_MAX = 64
+""" Upper limit of messages handled by ``Process.process_loop`` in one go,
+    before it yields to the event loop. Keeps signal handling latency bounded
+    when the inbox is busy. """
+
+_ATOM_NORMAL = Atom('normal')
+_ATOM_KILL = Atom('kill')
+_ATOM_KILLED = Atom('killed')
+_ATOM_DOWN = Atom('DOWN')
+_ATOM_PROCESS = Atom('process')
+_ATOM_UNHANDLED_EXC = Atom('unhandledexception')
+
+_LINKS_TUPLE_MAX = 8
+""" Links are stored in a tuple, which is smaller and faster to iterate than a
+    set, until there are more than this many of them. """
+
+_MATCH_CACHE_MAX = 16
+""" How many Match objects built from pattern tuples a process keeps, see
+    ``Process._compile_match``. """
+
+_DEFAULT_MATCH = Match()
+""" Catch-all match which returns raw messages, the default ``Process._match``.
+    Compared by identity to skip match dispatch for processes which did not
+    set their own. """
+
+
+class Inbox:
+    """ Message queue of a process. Works like ``asyncio.Queue`` without size
+        limit and without ``task_done``/``join`` accounting, which makes
+        delivering a message and waking up the waiting process cheaper.
+        Any number of producers may put messages, normally there is only one
+        consumer: the process itself.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._queue = collections.deque()
+        self._waiters = collections.deque()
+
+    def qsize(self) -> int:
+        return len(self._queue)
+
+    def empty(self) -> bool:
+        return not self._queue
+
+    def put_nowait(self, msg: Any) -> None:
+        self._queue.append(msg)
+        self._wake_up_next()
+
+    def put_front(self, msgs) -> None:
+        """ Put messages back in front of the queue, keeping their order, and
+            wake up as many waiters as there are messages. """
+        self._queue.extendleft(reversed(msgs))
+        for _ in range(len(msgs)):
+            if not self._waiters:
+                break
+            self._wake_up_next()
+
+    def get_nowait(self) -> Any:
+        """ :raises asyncio.QueueEmpty: if there are no messages """
+        if not self._queue:
+            raise asyncio.QueueEmpty
+        return self._queue.popleft()
+
+    async def get(self) -> Any:
+        queue = self._queue
+        while not queue:
+            waiter = self._loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # Timed out or cancelled, do not leave the waiter behind
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+                # Woken up but cancelled before taking the message, pass the
+                # wake up on to the next waiter
+                if not waiter.cancelled() and queue:
+                    self._wake_up_next()
+                raise
+        return queue.popleft()
+
+    def _wake_up_next(self) -> None:
+        waiters = self._waiters
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
 
 class Process:
     """ Implements Erlang process semantic and lifetime.
@@ -43,8 +141,10 @@ class Process:
 
     node_db = NodeDB()
     # if we want receive to always match and route in a specific way,
-    # we can put it here (should be list of `pyrlang.match.Match` object
-    _match = None
+    # we can put it here (should be a `pyrlang.match.Match` object). The
+    # default is a catch-all Match shared by all processes, it has no state.
+    # None (or any falsy value) also means the default.
+    _match = _DEFAULT_MATCH
 
     def __init__(self, passive: bool = False) -> None:
         """ Create a process and register itself. Pid is generated by the node
@@ -69,11 +169,20 @@ class Process:
         self.node_name_ = node_obj.node_name_  # type: str
         """ Convenience field to see the Node  """
 
-        self.inbox_ = asyncio.Queue()
-        """ Message queue. Messages are detected by the ``_run``
-            loop and handled one by one in ``handle_one_inbox_message()``. 
+        self._loop = node_obj.get_loop()
+        """ Event loop of the node, cached for creating tasks. """
+
+        self.inbox_ = Inbox(self._loop)
+        """ Message queue, an ``Inbox``. Messages are detected by the
+            ``process_loop`` and handled one by one in
+            ``handle_one_inbox_message()``. Passive processes read it with
+            ``await inbox_.get()`` or ``inbox_.get_nowait()``, note that
+            unlike ``asyncio.Queue`` it has no ``task_done``, ``join``,
+            ``full`` or ``maxsize``.
         """
-        self.__tmp_inbox = asyncio.Queue() # used for selective receives
+        self._saved = collections.deque()
+        """ Messages skipped by a selective receive, they are returned to the
+            inbox when receive finishes. """
 
         self.pid_ = node_obj.register_new_process(self)
         """ Process identifier for this object. Remember that when creating a 
@@ -86,99 +195,190 @@ class Process:
 
         self.is_exiting_ = False
 
-        self._monitored_by = dict()  # type: Dict[Reference, Pid]
+        # The monitor dicts are created on first use, many processes never
+        # link or monitor anything before they die.
+
+        self._monitored_by = None  # type: Optional[Dict[Reference, Pid]]
         """ Who monitors us. Either local or remote processes. """
 
-        self._monitors = dict()  # type: Dict[Reference, Pid]
+        self._monitors = None  # type: Optional[Dict[Reference, Pid]]
         """ Who we monitor. NOTE: For simplicity multiple monitors of same 
             target are not implemented. """
 
-        self._links = set()  # type: Set[Pid]
-        """ Bi-directional linked process pids. Each linked pid pair is unique
-            hence using a set to store them. """
+        self._links = ()  # type: Union[Tuple[Pid, ...], Set[Pid]]
+        """ Bi-directional linked process pids. Each linked pid pair is unique.
+            Few links are kept in a tuple, a set is used when there are more
+            than ``_LINKS_TUPLE_MAX`` of them. """
 
-        self._signals = asyncio.Queue()
-        """ Exit (and maybe later other) signals are placed here and handled
-            at safe moments of time between handling messages. """
+        self._match_cache = None  # type: Optional[collections.OrderedDict]
+        """ Match objects built from pattern tuples passed to ``receive``,
+            created on first use. """
+
+        self._run_task = None  # type: Optional[asyncio.Task]
+        """ Task running ``process_loop`` for active processes, cancelled
+            when the process exits. """
+
+        if type(self).deliver_message is Process.deliver_message:
+            # Skip the passive check for every message, unless the method
+            # is overridden in a subclass
+            self.deliver_message = self.handle_one_inbox_message \
+                if self.passive_ else self.inbox_.put_nowait
 
-        if not self._match:
-            self._match = Match()
         LOG.debug("Spawned process %s", self.pid_)
         if not self.passive_:
-            event_loop = asyncio.get_event_loop()
-            event_loop.create_task(self.process_loop())
-            event_loop.create_task(self.handle_signals())
+            self._run_task = self._loop.create_task(self.process_loop())
 
-    def __etf__(self):
+    def __etf__(self) -> Pid:
         """allow process objects to be put into messages to erlang"""
         return self.pid_
 
-    async def process_loop(self):
-        """ Polls inbox in an endless loop.
+    async def process_loop(self) -> None:
+        """ Polls inbox in an endless loop. An exception from the message
+            handler exits the process with reason ``unhandledexception``.
             .. note::
                 This will not be executed if the process was constructed with
                 ``passive=True`` (the default). Passive processes should read
                 their inbox directly from ``self.inbox_``.
         """
-        while not self.is_exiting_:
-            # If any messages have been handled recently, do not sleep
-            # Else if no messages, sleep for some short time
-            msg = await self.receive()
-            if msg:
-                self.handle_one_inbox_message(msg)
+        # Bound once, these are looked up for every message
+        inbox_get = self.inbox_.get
+        inbox_get_nowait = self.inbox_.get_nowait
+        handle = self.handle_one_inbox_message
+        try:
+            while not self.is_exiting_:
+                if (self._match or _DEFAULT_MATCH) is not _DEFAULT_MATCH:
+                    # Custom match is set, route messages via selective receive
+                    msg = await self.receive()
+                    if msg:
+                        handle(msg)
+                    continue
+
+                # Wait for one message, then handle what else has arrived
+                # without awaiting on the inbox for every message
+                msg = await inbox_get()
+                if msg:
+                    handle(msg)
+                for _ in range(BATCH_MAX):
+                    try:
+                        msg = inbox_get_nowait()
+                    except asyncio.QueueEmpty:
+                        break
+                    if msg:
+                        handle(msg)
+                else:
+                    # Inbox is still not empty, let the signals run
+                    await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            # Cancelled by _on_exit_signal, anything else is not our business
+            if not self.is_exiting_:
+                raise
+        except Exception:
+            LOG.exception("Process %s crashed in process_loop", self.pid_)
+            if not self.is_exiting_:
+                self._on_exit_signal(_ATOM_UNHANDLED_EXC)
+            return
 
         LOG.debug("Process %s process_loop stopped", self.pid_)
 
-    async def receive(self, match=None, timeout=None, timeout_callback=None):
+    async def receive(self,
+                      match: Union[Match, tuple, None] = None,
+                      timeout: Optional[float] = None,
+                      timeout_callback: Optional[Callable[[], Any]] = None
+                      ) -> Any:
+        """ Wait for a message which matches ``match``, other messages stay in
+            the inbox.
+            :param match: A ``pyrlang.match.Match``, or a tuple of patterns
+                which is compiled once and cached per process. Default is the
+                process ``_match``.
+        """
         if not timeout:
             return await self._receive(match)
 
         # timeout functionality
         try:
-            return await asyncio.wait_for(self._receive(match), timeout)
+            async with async_timeout(timeout):
+                return await self._receive(match)
         except asyncio.TimeoutError:
             if not callable(timeout_callback):
                 emsg = "receive in {} timed out".format(self)
                 raise errors.ProcessTimeoutError(emsg)
             return timeout_callback()
 
-    async def _receive(self, match=None):
-        LOG.debug("Starting receive")
-        # if no override use default
-        if not match:
-            match = self._match
-        if not self.__tmp_inbox.empty():
+    async def _receive(self,
+                       match: Union[Match, tuple, None] = None) -> Any:
+        # if no override use default, a falsy _match means the default too
+        match = match or self._match or _DEFAULT_MATCH
+        if match is _DEFAULT_MATCH:
+            # Catch-all match returns any message as is, nothing to select
+            return await self.inbox_.get()
+
+        # Check the log level once per receive, so that messages are only
+        # formatted for the log when debug logging is on
+        debug = LOG.isEnabledFor(logging.DEBUG)
+        if debug:
+            LOG.debug("Starting receive")
+        if isinstance(match, tuple):
+            match = self._compile_match(match)
+        if self._saved:
             raise ValueError("temporary inbox not empty")
-        while True:
-            msg = await self.inbox_.get()
-            LOG.debug("\n\ngot inbox {}, {}, {}".format(self, match, msg))
-            matched_pattern = match(msg)
-            if not matched_pattern:
-                self.__tmp_inbox.put_nowait(msg)
-                self.inbox_.task_done()  # not sure we can say done this early
-                continue
+        saved = self._saved
+        try:
+            while True:
+                msg = await self.inbox_.get()
+                if debug:
+                    LOG.debug("got inbox %s, %s, %s", self, match, msg)
+                # Saved while matching, so if the match function raises the
+                # message goes back to the inbox and is not lost
+                saved.append(msg)
+                matched_pattern = match(msg)
+                if matched_pattern:
+                    saved.pop()
+                    break
+        finally:
+            # Matched, timed out, cancelled or failed: return skipped
+            # messages to the inbox
             self._cleanup_inbox()
-            return matched_pattern.run(msg)
-
-    def _cleanup_inbox(self):
+        return matched_pattern.run(msg)
+
+    def _compile_match(self, patterns: tuple) -> Match:
+        """ Build a Match from a tuple of patterns, or reuse one built from an
+            equal tuple earlier. The cache belongs to the process because
+            patterns often hold its bound methods, a global cache would keep
+            exited processes alive. Keys compare by equality, a bound method
+            is a new object on every attribute access but equal to the others.
+            .. note::
+                Only patterns made of long lived functions or bound methods
+                can hit the cache. Lambdas and closures built per call, like
+                in ``GenServerInterface._do_call``, never do. Up to
+                ``_MATCH_CACHE_MAX`` of them and whatever they capture stay
+                alive until pushed out or the process is gone. Patterns given
+                as lists are not hashable and are never cached.
         """
-        move data around in inbox and tmp inbox
-        :return:
+        cache = self._match_cache
+        if cache is None:
+            cache = self._match_cache = collections.OrderedDict()
+        try:
+            match = cache.get(patterns, None)
+        except TypeError:
+            # Unhashable patterns, like lists of (match_fun, run_fun)
+            return Match(patterns)
+        if match is None:
+            match = cache[patterns] = Match(patterns)
+            if len(cache) > _MATCH_CACHE_MAX:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(patterns)
+        return match
+
+    def _cleanup_inbox(self) -> None:
+        """ Put the messages skipped by selective receive back in front of the
+            inbox, keeping their original order.
         """
-        while not self.inbox_.empty():
-            self.__tmp_inbox.put_nowait(self.inbox_.get_nowait())
-            self.inbox_.task_done()
-        while not self.__tmp_inbox.empty():
-            self.inbox_.put_nowait(self.__tmp_inbox.get_nowait())
-            self.__tmp_inbox.task_done()
-
-    async def handle_signals(self):
-        """ Called from Node if the Node knows that there's a signal waiting
-            to be handled. """
-        while True:
-            # Signals defer exiting a process while doing something important
-            (_exit, reason) = await self._signals.get()
-            self._on_exit_signal(reason)
+        saved = self._saved
+        if not saved:
+            return
+        self.inbox_.put_front(saved)
+        saved.clear()
 
     def handle_inbox(self) -> int:
         """ Do not override `handle_inbox`, instead go for
@@ -195,52 +395,86 @@ class Process:
         except asyncio.QueueEmpty:
             return n_handled
 
-    def handle_one_inbox_message(self, msg):
+    def handle_one_inbox_message(self, msg: Any) -> None:
         """ Override this method to handle new incoming messages. """
         LOG.error("%s: Unhandled msg %s" % (self.pid_, msg))
         pass
 
-    def deliver_message(self, msg):
+    def deliver_message(self, msg: Any) -> None:
         """ Places message into the inbox, or delivers it immediately to a
-            handler (if process is ``passive``). """
+            handler (if process is ``passive``).
+            .. note::
+                ``__init__`` replaces this with the matching bound method
+                (``inbox_.put_nowait`` or ``handle_one_inbox_message``).
+                Pass the message as a positional argument.
+        """
         if self.passive_:
             self.handle_one_inbox_message(msg)
         else:
             self.inbox_.put_nowait(msg)
 
-    def add_link(self, pid):
+    def add_link(self, pid: Pid) -> None:
         """ Links pid to this process.
             Please use Node method :py:meth:`~pyrlang.node.Node.link` for proper
             linking.
         """
-        self._links.add(pid)
-
-    def remove_link(self, pid):
+        links = self._links
+        if type(links) is not tuple:
+            links.add(pid)
+        elif pid not in links:
+            links += (pid,)
+            if len(links) > _LINKS_TUPLE_MAX:
+                links = set(links)
+            self._links = links
+
+    def remove_link(self, pid: Pid) -> None:
         """ Unlinks pid from this process.
             Please use Node method :py:meth:`~pyrlang.node.Node.unlink` for
             proper unlinking.
         """
-        self._links.remove(pid)
+        links = self._links
+        if type(links) is not tuple:
+            links.remove(pid)
+        elif pid in links:
+            self._links = tuple(link for link in links if link != pid)
+        else:
+            raise KeyError(pid)
 
-    def exit(self, reason=None):
+    def exit(self, reason: Any = None) -> None:
         """ Marks the object as exiting with the reason, informs links and
             monitors and unregisters the object from the node process
             dictionary.
+            The exit is handled by the event loop at a safe moment of time
+            between handling messages.
         """
-        self._signals.put_nowait(('exit', reason))
-        self.get_node().signal_wake_up(self.pid_)
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            self._loop.call_soon(self._on_exit_signal, reason)
+        else:
+            # Called from another thread, or before the loop is running
+            self._loop.call_soon_threadsafe(self._on_exit_signal, reason)
 
-    def _on_exit_signal(self, reason):
+    def _on_exit_signal(self, reason: Any) -> None:
         """ Internal function triggered between message handling. """
+        if self.is_exiting_:
+            return  # only the first exit signal counts
         if reason is None:
-            reason = Atom('normal')
+            reason = _ATOM_NORMAL
 
         self.is_exiting_ = True
-        self._trigger_monitors(reason)
-        self._trigger_links(reason)
-
-        n = self.node_db.get(self.node_name_)
-        n.on_exit_process(self.pid_, reason)
+        if self._run_task is not None:
+            self._run_task.cancel()
+        node = self.node_db.get_all().get(self.node_name_, None)
+        if node is None:
+            # The node was destroyed before this exit got handled, there is
+            # nobody left to notify
+            return
+        self._trigger_monitors(reason, node)
+        self._trigger_links(reason, node)
+        node.on_exit_process(self.pid_, reason)
 
     def get_node(self):
         """ Finds current node from global nodes dict by ``self.node_name_``.
@@ -249,63 +483,72 @@ class Process:
         """
         return self.node_db.get(self.node_name_)
 
-    def _trigger_monitors(self, reason):
+    def _trigger_monitors(self, reason: Any, node) -> None:
         """ On process exit inform all monitor owners that monitor us about the
             exit reason.
+            :type node: pyrlang.node.Node
         """
-        node = self.get_node()
+        if not self._monitored_by:
+            return
+        pid = self.pid_
         for (monitor_ref, monitor_owner) in self._monitored_by.items():
-            down_msg = (Atom("DOWN"),
-                        monitor_ref,
-                        Atom("process"),
-                        self.pid_,
-                        reason)
-            node.send_nowait(sender=self.pid_,
-                             receiver=monitor_owner,
-                             message=down_msg)
-
-    def _trigger_links(self, reason):
+            down_msg = (_ATOM_DOWN, monitor_ref, _ATOM_PROCESS, pid, reason)
+            node.send_nowait(pid, monitor_owner, down_msg)
+
+    def _trigger_links(self, reason: Any, node) -> None:
         """ Pass any exit reason other than 'normal' to linked processes.
             If Reason is 'kill' it will be converted to 'killed'.
+            :type node: pyrlang.node.Node
         """
         if isinstance(reason, Atom):
-            if reason == 'normal':
+            if reason == _ATOM_NORMAL:
                 return
 
-            elif reason == 'kill':
-                reason = Atom('killed')
+            elif reason == _ATOM_KILL:
+                reason = _ATOM_KILLED
 
-        node = self.get_node()
-        for link in self._links:
-            # For local pids, just forward them the exit signal
-            node.send_link_exit_notification(sender=self.pid_,
-                                             receiver=link,
-                                             reason=reason)
+        if not self._links:
+            return
+        node.send_link_exit_notifications(sender=self.pid_,
+                                          receivers=self._links,
+                                          reason=reason)
 
-    def add_monitor(self, pid: Pid, ref: Reference):
+    def add_monitor(self, pid: Pid, ref: Reference) -> None:
         """ Helper function. To monitor a process please use Node's
             :py:meth:`~pyrlang.node.Node.monitor_process`.
         """
+        if self._monitors is None:
+            self._monitors = dict()
         self._monitors[ref] = pid
 
-    def add_monitored_by(self, pid: Pid, ref: Reference):
+    def add_monitored_by(self, pid: Pid, ref: Reference) -> None:
         """ Helper function. To monitor a process please use Node's
             :py:meth:`~pyrlang.node.Node.monitor_process`.
         """
+        if self._monitored_by is None:
+            self._monitored_by = dict()
         self._monitored_by[ref] = pid
 
-    def remove_monitor(self, pid: Pid, ref: Reference):
+    def remove_monitor(self, pid: Pid, ref: Reference) -> None:
         """ Helper function. To demonitor a process please use Node's
             :py:meth:`~pyrlang.node.Node.demonitor_process`.
         """
-        existing = self._monitors.get(ref, None)
-        if existing == pid:
-            del self._monitors[ref]
-
-    def remove_monitored_by(self, pid: Pid, ref: Reference):
+        monitors = self._monitors
+        if not monitors:
+            return
+        # One dict operation when ref is monitored by pid, which it normally
+        # is, put back if it belongs to someone else
+        existing = monitors.pop(ref, None)
+        if existing is not None and existing != pid:
+            monitors[ref] = existing
+
+    def remove_monitored_by(self, pid: Pid, ref: Reference) -> None:
         """ Helper function. To demonitor a process please use Node's
             :py:meth:`~pyrlang.node.Node.demonitor_process`.
         """
-        existing = self._monitored_by.get(ref, None)
-        if existing == pid:
-            del self._monitored_by[ref]
+        monitors = self._monitored_by
+        if not monitors:
+            return
+        existing = monitors.pop(ref, None)
+        if existing is not None and existing != pid:
+            monitors[ref] = existing
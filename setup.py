@@ -9,5 +9,5 @@ setup(name='pyrlang',
       packages=find_packages(),
     # The library requires either asyncio or Gevent, you can relax this
     # dependency if Gevent is not desired
-      install_requires=[]
+      install_requires=['async_timeout>=3.0; python_version < "3.11"']
       )
@@ -0,0 +1,64 @@
+import asyncio
+import unittest
+
+from pyrlang.process import Inbox
+
+
+class TestInbox(unittest.TestCase):
+    def setUp(self):
+        self.loop_ = asyncio.new_event_loop()
+        self.inbox_ = Inbox(self.loop_)
+
+    def tearDown(self):
+        self.loop_.close()
+
+    def test_put_get_order(self):
+        for i in range(3):
+            self.inbox_.put_nowait(i)
+        self.assertEqual(self.inbox_.qsize(), 3)
+
+        async def get_all():
+            return [await self.inbox_.get() for _ in range(3)]
+
+        self.assertEqual(self.loop_.run_until_complete(get_all()), [0, 1, 2])
+        self.assertTrue(self.inbox_.empty())
+
+    def test_get_nowait_empty(self):
+        self.assertRaises(asyncio.QueueEmpty, self.inbox_.get_nowait)
+
+    def test_cancelled_after_wake_up_passes_message_on(self):
+        async def run():
+            t1 = self.loop_.create_task(self.inbox_.get())
+            t2 = self.loop_.create_task(self.inbox_.get())
+            await asyncio.sleep(0)
+            # t1 is woken up by the put, but cancelled before it runs
+            self.inbox_.put_nowait('msg')
+            t1.cancel()
+            return await t2
+
+        self.assertEqual(self.loop_.run_until_complete(run()), 'msg')
+
+    def test_put_front_keeps_order_and_wakes_up(self):
+        async def run():
+            waiter = self.loop_.create_task(self.inbox_.get())
+            await asyncio.sleep(0)
+            self.inbox_.put_front(['a', 'b'])
+            first = await waiter
+            return [first, self.inbox_.get_nowait()]
+
+        self.assertEqual(self.loop_.run_until_complete(run()), ['a', 'b'])
+
+    def test_waiters_removed_after_timeout(self):
+        async def run():
+            for _ in range(10):
+                try:
+                    await asyncio.wait_for(self.inbox_.get(), 0.0001)
+                except asyncio.TimeoutError:
+                    pass
+
+        self.loop_.run_until_complete(run())
+        self.assertEqual(len(self.inbox_._waiters), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import asyncio
+import unittest
+
+from pyrlang.match import Match
+from pyrlang.process import Process, _LINKS_TUPLE_MAX
+from term import Atom, Pid
+
+
+class FakeNode:
+    """ Just enough of a Node for processes to register and exit. """
+    node_name_ = 'process_test@127.0.0.1'
+
+    def __init__(self, loop):
+        self._event_loop = loop
+        self.processes_ = {}
+        self.pid_counter_ = 0
+        self.exits_ = []
+        Process.node_db.register(self)
+
+    def get_loop(self):
+        return self._event_loop
+
+    def register_new_process(self, proc=None):
+        self.pid_counter_ += 1
+        pid = Pid(node_name=self.node_name_, id=0,
+                  serial=self.pid_counter_, creation=1)
+        if proc is not None:
+            self.processes_[pid] = proc
+        return pid
+
+    def on_exit_process(self, exiting_pid, reason):
+        self.exits_.append((exiting_pid, reason))
+        del self.processes_[exiting_pid]
+
+    def send_nowait(self, sender, receiver, message):
+        pass
+
+    def send_link_exit_notifications(self, sender, receivers, reason):
+        pass
+
+
+class CrashingProcess(Process):
+    def handle_one_inbox_message(self, msg):
+        raise RuntimeError("crash on %s" % msg)
+
+
+class TestProcess(unittest.TestCase):
+    def setUp(self):
+        self.loop_ = asyncio.new_event_loop()
+        self.node_ = FakeNode(self.loop_)
+
+    def tearDown(self):
+        for proc in list(self.node_.processes_.values()):
+            proc.exit()
+        self.run_async(asyncio.sleep(0.01))
+        Process.node_db.remove(self.node_)
+        self.loop_.close()
+
+    def run_async(self, coro):
+        return self.loop_.run_until_complete(coro)
+
+    def test_selective_receive_keeps_inbox_order(self):
+        p = Process(passive=True)
+        for m in ['a', 'b', 'c', 'd']:
+            p.inbox_.put_nowait(m)
+        match = Match([(lambda m: m == 'c', None)])
+        self.assertEqual(self.run_async(p.receive(match)), 'c')
+        self.assertEqual([p.inbox_.get_nowait() for _ in range(3)],
+                         ['a', 'b', 'd'])
+
+    def test_timed_out_receive_keeps_inbox_order(self):
+        p = Process(passive=True)
+        for m in ['a', 'b']:
+            p.inbox_.put_nowait(m)
+        match = Match([(lambda m: m == 'z', None)])
+        result = self.run_async(p.receive(match, timeout=0.01,
+                                          timeout_callback=lambda: 'timeout'))
+        self.assertEqual(result, 'timeout')
+        self.assertEqual([p.inbox_.get_nowait() for _ in range(2)],
+                         ['a', 'b'])
+
+    def test_failed_match_keeps_inbox_order(self):
+        p = Process(passive=True)
+        for m in ['x', 1, 'y']:
+            p.inbox_.put_nowait(m)
+
+        def bad_match(msg):
+            if msg == 1:
+                raise ValueError("bad match")
+            return False
+
+        with self.assertRaises(ValueError):
+            self.run_async(p.receive(Match([(bad_match, None)])))
+        self.assertEqual([p.inbox_.get_nowait() for _ in range(3)],
+                         ['x', 1, 'y'])
+
+    def test_handler_exception_exits_process(self):
+        p = CrashingProcess()
+        p.deliver_message('boom')
+        self.run_async(asyncio.sleep(0.01))
+        self.assertEqual(self.node_.exits_, [(p.pid_, Atom('unhandledexception'))])
+        self.assertTrue(p.is_exiting_)
+        self.assertTrue(p._run_task.done())
+
+    def test_exit_twice_only_first_counts(self):
+        p = Process()
+        p.exit(Atom('first'))
+        p.exit(Atom('second'))
+        self.run_async(asyncio.sleep(0.01))
+        self.assertEqual(self.node_.exits_, [(p.pid_, Atom('first'))])
+
+    def test_exit_from_another_thread(self):
+        p = Process()
+
+        async def exit_in_thread():
+            await self.loop_.run_in_executor(None, p.exit, Atom('from_thread'))
+            await asyncio.sleep(0.01)
+
+        self.run_async(exit_in_thread())
+        self.assertEqual(self.node_.exits_, [(p.pid_, Atom('from_thread'))])
+        self.assertTrue(p._run_task.done())
+
+    def test_links_switch_to_set_above_tuple_max(self):
+        p = Process()
+        pids = [self.node_.register_new_process()
+                for _ in range(_LINKS_TUPLE_MAX + 1)]
+        for pid in pids[:-1]:
+            p.add_link(pid)
+            p.add_link(pid)
+        self.assertIsInstance(p._links, tuple)
+        self.assertEqual(len(p._links), _LINKS_TUPLE_MAX)
+
+        p.add_link(pids[-1])
+        self.assertIsInstance(p._links, set)
+        self.assertEqual(p._links, set(pids))
+
+        p.remove_link(pids[0])
+        self.assertEqual(p._links, set(pids[1:]))
+
+    def test_remove_missing_link_raises(self):
+        p = Process()
+        missing = self.node_.register_new_process()
+        p.add_link(self.node_.register_new_process())
+        self.assertIsInstance(p._links, tuple)
+        with self.assertRaises(KeyError):
+            p.remove_link(missing)
+
+        for _ in range(_LINKS_TUPLE_MAX):
+            p.add_link(self.node_.register_new_process())
+        self.assertIsInstance(p._links, set)
+        with self.assertRaises(KeyError):
+            p.remove_link(missing)
+
+
+if __name__ == '__main__':
+    unittest.main()